@@ -1,16 +1,19 @@
 import os
+import asyncio
 import tempfile
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Form, Query, Request
 from fastapi.responses import JSONResponse, FileResponse
-from typing import List
+from typing import List, Optional
 
 from app.models.schemas import (
     CreateScriptRequest,
     CreateScriptResponse,
     DocumentResponse,
     ErrorResponse,
+    AudioFormat,
     DirectScriptGenerationResponse,
     TextToSpeechRequest,
+    TextToSpeechDownloadRequest,
     TextToSpeechResponse
 )
 from app.utils.helpers import (
@@ -19,8 +22,11 @@ from app.utils.helpers import (
     generate_script_with_gemini,
     load_speaker_modes,
     save_generated_script,
-    convert_text_to_speech
+    synthesize_speech,
+    SpeechInProgressError,
+    TTS_RETRY_AFTER
 )
+from app.utils.audio import build_audio_response, get_audio_variant
 
 router = APIRouter()
 
@@ -43,7 +49,8 @@ async def upload_document(file: UploadFile = File(...)):
 
         try:
             # Extract text from the PDF
-            text_content, page_count = extract_text_from_pdf(temp_file.name)
+            text_content, page_count = await asyncio.to_thread(
+                extract_text_from_pdf, temp_file.name)
 
             if not text_content:
                 raise HTTPException(
@@ -101,7 +108,8 @@ async def upload_and_generate(file: UploadFile = File(...), speaker_mode: str =
 
         try:
             # Extract text from the PDF
-            text_content, page_count = extract_text_from_pdf(temp_file.name)
+            text_content, page_count = await asyncio.to_thread(
+                extract_text_from_pdf, temp_file.name)
 
             if not text_content:
                 raise HTTPException(
@@ -114,8 +122,8 @@ async def upload_and_generate(file: UploadFile = File(...), speaker_mode: str =
             script = await generate_script_with_gemini(prompt)
 
             # Save the generated script to a file
-            file_path = save_generated_script(
-                script, speaker_mode, len(text_content))
+            file_path = await asyncio.to_thread(
+                save_generated_script, script, speaker_mode, len(text_content))
 
             # Return the response with all the required fields
             return DirectScriptGenerationResponse(
@@ -155,7 +163,7 @@ async def text_to_speech(request: TextToSpeechRequest):
     """
     try:
         # Call the helper function to convert text to speech
-        audio_file_path = await convert_text_to_speech(
+        audio_file_path = await synthesize_speech(
             text=request.text,
             voice_id=request.voice_id,
             model_id=request.model_id,
@@ -163,10 +171,17 @@ async def text_to_speech(request: TextToSpeechRequest):
             similarity_boost=request.similarity_boost
         )
 
+        audio_id = os.path.splitext(os.path.basename(audio_file_path))[0]
+
         return TextToSpeechResponse(
             audio_file_path=audio_file_path,
+            audio_id=audio_id,
+            audio_url=f"/api/audio/{audio_id}",
             status="success"
         )
+    except SpeechInProgressError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(TTS_RETRY_AFTER)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -175,13 +190,13 @@ async def text_to_speech(request: TextToSpeechRequest):
 
 
 @router.post("/text_to_speech/download")
-async def text_to_speech_download(request: TextToSpeechRequest):
+async def text_to_speech_download(request: TextToSpeechDownloadRequest):
     """
     Convert text to speech and return the audio file for download
     """
     try:
         # Call the helper function to convert text to speech
-        audio_file_path = await convert_text_to_speech(
+        audio_file_path = await synthesize_speech(
             text=request.text,
             voice_id=request.voice_id,
             model_id=request.model_id,
@@ -189,14 +204,50 @@ async def text_to_speech_download(request: TextToSpeechRequest):
             similarity_boost=request.similarity_boost
         )
 
+        # Transcode if a different format or bitrate was requested
+        audio_id = os.path.splitext(os.path.basename(audio_file_path))[0]
+        file_path, media_type = await get_audio_variant(
+            audio_id, request.output_format.value, request.bitrate)
+
         # Return the file for download
         return FileResponse(
-            path=audio_file_path,
-            filename=os.path.basename(audio_file_path),
-            media_type="audio/mpeg"
+            path=file_path,
+            filename=os.path.basename(file_path),
+            media_type=media_type,
+            headers={"X-Audio-Id": audio_id}
         )
+    except SpeechInProgressError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(TTS_RETRY_AFTER)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error generating speech: {str(e)}")
+
+
+@router.api_route("/audio/{audio_id}", methods=["GET", "HEAD"], responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}})
+async def get_audio(
+    request: Request,
+    audio_id: str,
+    audio_format: AudioFormat = Query(
+        AudioFormat.mp3, alias="format", description="Output audio format"),
+    bitrate: Optional[str] = Query(
+        None, description="Output bitrate, e.g. 32k for low-bitrate previews")
+):
+    """
+    Stream a generated audio file by its artifact ID.
+    Supports Range requests, ETag and conditional GET, and optional transcoding.
+    """
+    try:
+        file_path, media_type = await get_audio_variant(
+            audio_id, audio_format.value, bitrate)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error preparing audio: {str(e)}")
+
+    return build_audio_response(request, file_path, media_type)
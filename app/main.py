@@ -1,17 +1,44 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 
 from app.api.routes import router
+from app.utils.admission import AdmissionControlMiddleware, build_limiters, collect_stats, publish_stats_periodically
+
+# Admission limiters, one per endpoint class
+admission_limiters = build_limiters()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each worker, so every worker publishes its own gauges
+    publisher = asyncio.create_task(
+        publish_stats_periodically(admission_limiters))
+    yield
+    publisher.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await publisher
 
 # Create FastAPI app
 app = FastAPI(
     title="LearnTube API",
     description="API for document processing and script generation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Add admission control middleware. Each endpoint class gets its own
+# concurrency limit and wait queue so a burst of expensive uploads cannot
+# starve cheap endpoints. Added before CORS so 429 responses carry CORS headers.
+app.add_middleware(AdmissionControlMiddleware, limiters=admission_limiters)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -37,5 +64,62 @@ async def global_exception_handler(request: Request, exc: Exception):
 async def root():
     return {"message": "Welcome to LearnTube API", "status": "success"}
 
+# Admission queue-depth gauges per endpoint class, summed over all workers
+@app.get("/admission_stats")
+async def admission_stats():
+    return await asyncio.to_thread(collect_stats, admission_limiters)
+
+
+def run_production(host: str, port: int, workers: int):
+    """
+    Run N workers under gunicorn with the app preloaded in the master
+    process. SIGHUP gracefully restarts the workers, but from the code the
+    master already loaded. To deploy new code, send USR2 to start a new
+    master, then WINCH and QUIT to the old one (or restart the process).
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+        import uvicorn_worker  # noqa: F401
+    except ImportError:
+        # gunicorn or uvicorn-worker is not available (e.g. on Windows), fall back to
+        # uvicorn's own process manager without preloading
+        uvicorn.run("app.main:app", host=host, port=port, workers=workers)
+        return
+
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn_worker.UvicornWorker")
+            self.cfg.set("preload_app", True)
+            self.cfg.set("timeout", int(os.getenv("WORKER_TIMEOUT", 180)))
+            self.cfg.set("graceful_timeout", int(os.getenv("GRACEFUL_TIMEOUT", 60)))
+            self.cfg.set("keepalive", 5)
+            # Recycle workers periodically to contain memory growth
+            self.cfg.set("max_requests", int(os.getenv("MAX_REQUESTS", 2000)))
+            self.cfg.set("max_requests_jitter", 200)
+
+        def load(self):
+            return app
+
+    # gunicorn re-executes sys.argv on USR2. Started with "python -m app.main",
+    # argv[0] is the path to this file, which cannot import the app package
+    # when run as a script, so re-exec it as a module instead
+    sys.argv = ["-m", "app.main"] + sys.argv[1:]
+    ProductionApplication().run()
+
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    parser = argparse.ArgumentParser(description="Run the LearnTube API")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--production", action="store_true",
+                        help="Run multiple workers without auto-reload")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", os.cpu_count() or 1)),
+                        help="Number of worker processes in production mode")
+    args = parser.parse_args()
+
+    if args.production:
+        run_production(args.host, args.port, args.workers)
+    else:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True)
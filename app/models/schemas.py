@@ -1,6 +1,15 @@
-from pydantic import BaseModel, Field
+from enum import Enum
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 
+from app.utils.audio import parse_bitrate
+
+
+class AudioFormat(str, Enum):
+    mp3 = "mp3"
+    opus = "opus"
+    aac = "aac"
+
 
 class CreateScriptRequest(BaseModel):
     document_content: str = Field(...,
@@ -51,8 +60,26 @@ class TextToSpeechRequest(BaseModel):
         default=0.5, description="Voice similarity boost (0-1)")
 
 
+class TextToSpeechDownloadRequest(TextToSpeechRequest):
+    output_format: AudioFormat = Field(default=AudioFormat.mp3,
+                                       description="Format of the returned audio")
+    bitrate: Optional[str] = Field(default=None,
+                                   description="Output bitrate, e.g. 32k, rounded to the nearest of 24k, 32k, 48k, 64k, 96k and 128k")
+
+    @field_validator("bitrate")
+    @classmethod
+    def validate_bitrate(cls, value: Optional[str]) -> Optional[str]:
+        # Reject bad values before any speech is generated
+        parse_bitrate(value)
+        return value
+
+
 class TextToSpeechResponse(BaseModel):
     audio_file_path: str = Field(...,
                                  description="Path to the generated audio file")
+    audio_id: str = Field(...,
+                          description="Artifact ID of the generated audio")
+    audio_url: str = Field(...,
+                           description="URL to stream the generated audio from")
     status: str = Field(default="success",
                         description="Status of the operation")
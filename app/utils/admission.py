@@ -0,0 +1,244 @@
+import asyncio
+import math
+import os
+import time
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.utils.store import SharedStore, shared_store
+
+
+# Endpoint classes and the paths that belong to them. Anything not listed
+# here falls into the "cheap" class.
+MEDIA_PREFIXES = (
+    "/api/audio/",
+)
+
+EXPENSIVE_PATHS = (
+    "/api/upload_document",
+    "/api/upload_and_generate",
+    "/api/create_script",
+    "/api/text_to_speech",
+    "/api/text_to_speech/download",
+)
+
+# (max concurrency, max queued, queue timeout in seconds, requests per
+# client per minute) per endpoint class. Concurrency and queue limits apply
+# to each worker process; the rate limit is shared by all workers, and 0
+# disables it.
+DEFAULT_LIMITS = {
+    "cheap": (64, 256, 5.0, 0),
+    "media": (16, 64, 10.0, 0),
+    "expensive": (4, 16, 30.0, 0),
+}
+
+RATE_WINDOW = 60
+
+# How often each worker publishes its gauges to the shared store, and how
+# long they stay visible after a worker stops publishing (i.e. has exited)
+STATS_INTERVAL = 1.0
+STATS_TTL = 15.0
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limit with a bounded wait queue for one endpoint class.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float, rate_limit: int = 0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_limit = rate_limit
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self) -> bool:
+        """
+        Wait for a slot. Returns False straight away when the queue is full,
+        or once the queue timeout expires.
+        """
+        if not self._semaphore.locked():
+            # A slot is free, so this does not block
+            await self._semaphore.acquire()
+        else:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                return False
+
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+            finally:
+                self.queued -= 1
+
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        # A full queue drains in about one queue timeout at worst
+        return max(1, math.ceil(self.queue_timeout))
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def build_limiters() -> Dict[str, AdmissionLimiter]:
+    """
+    Create one limiter per endpoint class. Limits can be overridden with
+    ADMISSION_<CLASS>_CONCURRENCY, ADMISSION_<CLASS>_QUEUE,
+    ADMISSION_<CLASS>_TIMEOUT and ADMISSION_<CLASS>_RATE environment variables.
+    """
+    limiters = {}
+    for name, (concurrency, queue, timeout, rate) in DEFAULT_LIMITS.items():
+        prefix = f"ADMISSION_{name.upper()}"
+        limiters[name] = AdmissionLimiter(
+            name=name,
+            max_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+            max_queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+            queue_timeout=float(os.getenv(f"{prefix}_TIMEOUT", timeout)),
+            rate_limit=int(os.getenv(f"{prefix}_RATE", rate)),
+        )
+    return limiters
+
+
+def publish_stats(limiters: Dict[str, AdmissionLimiter], store: SharedStore = shared_store) -> None:
+    """
+    Publish this worker's gauges so any worker can report on all of them.
+    """
+    store.set(
+        f"admission:{os.getpid()}",
+        {name: limiter.snapshot() for name, limiter in limiters.items()},
+        ttl=STATS_TTL,
+    )
+
+
+async def publish_stats_periodically(limiters: Dict[str, AdmissionLimiter], store: SharedStore = shared_store) -> None:
+    """
+    Publish this worker's gauges every STATS_INTERVAL seconds, so they stay
+    current even while every slot is busy with long requests. Run one per
+    worker process.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(publish_stats, limiters, store)
+        except Exception:
+            # Gauges are best effort, keep trying on the next tick
+            pass
+        await asyncio.sleep(STATS_INTERVAL)
+
+
+def collect_stats(limiters: Dict[str, AdmissionLimiter], store: SharedStore = shared_store) -> dict:
+    """
+    Sum the gauges of every live worker, per endpoint class.
+    """
+    publish_stats(limiters, store)
+
+    totals = {}
+    for worker_stats in store.scan("admission:").values():
+        for name, snapshot in worker_stats.items():
+            class_totals = totals.setdefault(name, dict.fromkeys(snapshot, 0))
+            for field, value in snapshot.items():
+                class_totals[field] = class_totals.get(field, 0) + value
+    return totals
+
+
+def classify_path(path: str) -> str:
+    if path.rstrip("/") in EXPENSIVE_PATHS:
+        return "expensive"
+    # Audio streams hold their slot for the whole transfer and may transcode,
+    # so keep them away from the cheap class
+    if path.startswith(MEDIA_PREFIXES):
+        return "media"
+    return "cheap"
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware that admits each HTTP request through the limiter of
+    its endpoint class and sheds load with 429 responses when the class's
+    queue is full or a client is over its rate limit.
+    """
+
+    def __init__(self, app: ASGIApp, limiters: Optional[Dict[str, AdmissionLimiter]] = None, store: SharedStore = shared_store):
+        self.app = app
+        self.limiters = limiters if limiters is not None else build_limiters()
+        self.store = store
+
+    def _reject(self, detail: str, retry_after: int) -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": detail, "status": "error"},
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    async def _over_rate_limit(self, limiter: AdmissionLimiter, scope: Scope) -> Optional[int]:
+        """
+        Count the request against the client's shared rate limit. Returns
+        the seconds until the window resets if the client is over it.
+        """
+        client = scope.get("client")
+        client_host = client[0] if client else "unknown"
+        now = time.time()
+        window = int(now // RATE_WINDOW)
+
+        try:
+            count = await asyncio.to_thread(
+                self.store.incr, f"rate:{limiter.name}:{client_host}:{window}", 1, RATE_WINDOW)
+        except Exception:
+            # Fail open if the shared store is unavailable
+            return None
+        if count <= limiter.rate_limit:
+            return None
+        return max(1, math.ceil((window + 1) * RATE_WINDOW - now))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters.get(classify_path(scope["path"]))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if limiter.rate_limit:
+            retry_after = await self._over_rate_limit(limiter, scope)
+            if retry_after is not None:
+                limiter.rejected += 1
+                response = self._reject(
+                    f"Rate limit of {limiter.rate_limit} {limiter.name} requests per minute exceeded", retry_after)
+                await response(scope, receive, send)
+                return
+
+        if not await limiter.acquire():
+            response = self._reject(
+                f"Server is busy handling {limiter.name} requests, please retry later", limiter.retry_after())
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,343 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from app.utils.store import shared_store
+
+
+# Output format -> (file extension, media type, ffmpeg arguments)
+AUDIO_FORMATS = {
+    "mp3": ("mp3", "audio/mpeg", ["-c:a", "libmp3lame", "-f", "mp3"]),
+    "opus": ("ogg", "audio/ogg", ["-c:a", "libopus", "-f", "ogg"]),
+    "aac": ("m4a", "audio/mp4", ["-c:a", "aac", "-f", "ipod"]),
+}
+
+# Bitrates (kbit/s) variants are encoded at. Requested bitrates are rounded
+# to the nearest one, so each artifact has a handful of variants at most.
+ALLOWED_BITRATES = (24, 32, 48, 64, 96, 128)
+
+# Transcoded variants are evicted, oldest first, once they exceed this total
+# size or age
+VARIANTS_MAX_BYTES = int(os.getenv("VARIANTS_MAX_BYTES", 512 * 1024 * 1024))
+VARIANTS_MAX_AGE = int(os.getenv("VARIANTS_MAX_AGE", 7 * 24 * 60 * 60))
+
+CHUNK_SIZE = 64 * 1024
+
+# Generated artifacts never change once written, so clients may cache them
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Seconds a single ffmpeg run may take before it is killed
+TRANSCODE_TIMEOUT = 120
+
+# ffmpeg runs on its own small pool, so slow transcodes can neither starve
+# the default executor nor run without bound
+_transcode_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRANSCODE_WORKERS", 2)), thread_name_prefix="transcode")
+
+# Transcodes in progress in this worker, by variant path
+_transcodes: Dict[str, asyncio.Future] = {}
+
+
+def get_audio_dir() -> str:
+    return os.path.join(os.getcwd(), "generated_audio")
+
+
+def get_audio_path(audio_id: str) -> Optional[str]:
+    """
+    Return the path of the original MP3 for an artifact ID, or None if the
+    ID is malformed or unknown.
+    """
+    try:
+        audio_id = str(uuid.UUID(audio_id))
+    except ValueError:
+        return None
+
+    path = os.path.join(get_audio_dir(), f"{audio_id}.mp3")
+    return path if os.path.isfile(path) else None
+
+
+def parse_bitrate(bitrate: Optional[str]) -> Optional[int]:
+    """
+    Parse a bitrate like "32k" or "32000" into kbit/s, rounded to the
+    nearest of ALLOWED_BITRATES.
+    """
+    if bitrate is None:
+        return None
+
+    match = re.fullmatch(r"(\d{1,6})([kK]?)", bitrate.strip())
+    if not match:
+        raise ValueError(f"Invalid bitrate: {bitrate}. Use a value like 32k")
+
+    kbps = int(match.group(1)) if match.group(2) else int(match.group(1)) // 1000
+    if not 6 <= kbps <= 320:
+        raise ValueError("Bitrate must be between 6k and 320k")
+    return min(ALLOWED_BITRATES, key=lambda allowed: abs(allowed - kbps))
+
+
+def get_variant_path(audio_id: str, audio_format: str, kbps: Optional[int]) -> str:
+    extension, _, _ = AUDIO_FORMATS[audio_format]
+    suffix = f"{kbps}k" if kbps else "default"
+    return os.path.join(
+        get_audio_dir(), "variants", f"{audio_id}.{suffix}.{extension}")
+
+
+def transcode_audio(source_path: str, variant_path: str, audio_format: str, kbps: Optional[int]) -> str:
+    """
+    Transcode an artifact into the requested format and bitrate with ffmpeg.
+    """
+    _, _, codec_args = AUDIO_FORMATS[audio_format]
+    os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg is required to transcode audio but was not found on PATH")
+
+    command = [ffmpeg, "-y", "-loglevel", "error", "-i", source_path, "-vn"] + codec_args
+    if kbps:
+        command += ["-b:a", f"{kbps}k"]
+
+    # Write to a temporary file and rename it, so concurrent requests never
+    # serve a half-written variant
+    temp_path = f"{variant_path}.{uuid.uuid4().hex}.tmp"
+    command.append(temp_path)
+
+    try:
+        result = subprocess.run(
+            command, capture_output=True, text=True, timeout=TRANSCODE_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+        os.replace(temp_path, variant_path)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(
+            f"ffmpeg did not finish within {TRANSCODE_TIMEOUT} seconds")
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    prune_variants(os.path.dirname(variant_path), keep=variant_path)
+    return variant_path
+
+
+def prune_variants(variants_dir: str, keep: Optional[str] = None) -> None:
+    """
+    Evict the oldest variants until the cache is within VARIANTS_MAX_BYTES
+    and VARIANTS_MAX_AGE. The variant just written is always kept.
+    """
+    entries = []
+    for entry in os.scandir(variants_dir):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - VARIANTS_MAX_AGE
+    for mtime, size, path in entries:
+        if path == keep or (total <= VARIANTS_MAX_BYTES and mtime >= cutoff):
+            continue
+        try:
+            os.unlink(path)
+            total -= size
+        except FileNotFoundError:
+            # Another worker evicted it first
+            total -= size
+
+
+def _claim_and_transcode(source_path: str, variant_path: str, audio_format: str, kbps: Optional[int]) -> Optional[str]:
+    """
+    Transcode the variant unless it already exists or another worker is
+    encoding it. Returns None in the latter case.
+    """
+    if os.path.isfile(variant_path):
+        return variant_path
+
+    lock_key = f"transcode:{os.path.basename(variant_path)}"
+    if not shared_store.add(lock_key, os.getpid(), ttl=TRANSCODE_TIMEOUT + 30):
+        return None
+    try:
+        return transcode_audio(source_path, variant_path, audio_format, kbps)
+    finally:
+        shared_store.delete(lock_key)
+
+
+async def _transcode_shared(source_path: str, variant_path: str, audio_format: str, kbps: Optional[int]) -> str:
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + TRANSCODE_TIMEOUT + 30
+    while True:
+        path = await loop.run_in_executor(
+            _transcode_executor, _claim_and_transcode, source_path, variant_path, audio_format, kbps)
+        if path is not None:
+            return path
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out waiting for another worker to transcode the audio")
+        # Another worker is encoding this variant, wait for it to appear
+        await asyncio.sleep(0.25)
+
+
+async def transcode_variant(source_path: str, audio_id: str, audio_format: str, kbps: Optional[int]) -> str:
+    """
+    Return the cached variant, encoding it first if needed. Concurrent
+    requests for the same variant share a single ffmpeg run, within this
+    worker and across workers.
+    """
+    variant_path = get_variant_path(audio_id, audio_format, kbps)
+    if os.path.isfile(variant_path):
+        return variant_path
+
+    task = _transcodes.get(variant_path)
+    if task is None:
+        task = asyncio.ensure_future(
+            _transcode_shared(source_path, variant_path, audio_format, kbps))
+        _transcodes[variant_path] = task
+        task.add_done_callback(lambda _: _transcodes.pop(variant_path, None))
+
+    # Shield the shared task so one client disconnecting does not cancel it for the rest
+    return await asyncio.shield(task)
+
+
+async def get_audio_variant(audio_id: str, audio_format: str = "mp3", bitrate: Optional[str] = None) -> tuple[str, str]:
+    """
+    Resolve an artifact ID to the file to serve and its media type,
+    transcoding it first if a different format or bitrate was requested.
+    """
+    source_path = get_audio_path(audio_id)
+    if source_path is None:
+        raise FileNotFoundError(f"Audio {audio_id} not found")
+
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(
+            f"Invalid format: {audio_format}. Available formats: {', '.join(AUDIO_FORMATS)}")
+
+    kbps = parse_bitrate(bitrate)
+    _, media_type, _ = AUDIO_FORMATS[audio_format]
+
+    # The original is already an MP3, serve it as is
+    if audio_format == "mp3" and kbps is None:
+        return source_path, media_type
+
+    path = await transcode_variant(
+        source_path, str(uuid.UUID(audio_id)), audio_format, kbps)
+    return path, media_type
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+
+def _parse_range(header: str, file_size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" range. Returns None for ranges we do not
+    handle (such as multiple ranges), so the full file is served instead.
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(file_size - length, 0), file_size - 1
+
+    start = int(start)
+    if start >= file_size:
+        raise ValueError("Unsatisfiable range")
+    end = min(int(end), file_size - 1) if end else file_size - 1
+    if start > end:
+        return None
+    return start, end
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def build_audio_response(request: Request, path: str, media_type: str) -> Response:
+    """
+    Serve an audio file with ETag, Last-Modified, conditional GET (304)
+    and single byte-range (206) support.
+    """
+    stat = os.stat(path)
+    file_size = stat.st_size
+    etag_source = f"{os.path.basename(path)}-{file_size}-{stat.st_mtime_ns}"
+    etag = f'"{hashlib.md5(etag_source.encode()).hexdigest()}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+    # Conditional GET: If-None-Match takes precedence over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since:
+        try:
+            if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range only honours the range when the client's copy is still current
+    if range_header and (if_range is None or if_range.strip() in (etag, last_modified)):
+        try:
+            byte_range = _parse_range(range_header, file_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        status_code, start, length = 200, 0, file_size
+    else:
+        start, end = byte_range
+        status_code, length = 206, end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(length)
+
+    # HEAD lets clients probe the size without reading the file
+    if request.method == "HEAD":
+        return Response(status_code=status_code, media_type=media_type, headers=headers)
+
+    return StreamingResponse(
+        _iter_file(path, start, length),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -7,15 +7,36 @@ from pathlib import Path
 import re
 import datetime
 import asyncio
+import hashlib
+import logging
+import time
 import uuid
 from elevenlabs import generate, save, set_api_key
 from elevenlabs.api import Voice, VoiceSettings
 
+from app.utils.store import shared_store
+
+
+logger = logging.getLogger(__name__)
+
 
 # Load environment variables
 load_dotenv(Path(__file__).parent.parent / ".env")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# A text-to-speech claim is refreshed every TTS_HEARTBEAT_INTERVAL while the
+# audio is generated, and another worker takes it over only once it has gone
+# TTS_PENDING_TTL without a refresh. Identical requests poll for a few seconds
+# (TTS_WAIT_TIMEOUT) and are then told to retry after TTS_RETRY_AFTER, so
+# they do not sit on an expensive admission slot. A finished job is reused
+# for TTS_RESULT_TTL.
+TTS_PENDING_TTL = 30
+TTS_HEARTBEAT_INTERVAL = 10
+TTS_POLL_INTERVAL = 0.5
+TTS_WAIT_TIMEOUT = 5
+TTS_RETRY_AFTER = 10
+TTS_RESULT_TTL = 24 * 60 * 60
+
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY environment variable is not set")
 
@@ -166,8 +187,9 @@ def save_generated_script(script: str, speaker_mode: str, document_length: int)
     sanitized_speaker_mode = re.sub(
         r'[^\w\s-]', '', speaker_mode).replace(' ', '_').lower()
 
-    # Generate filename
-    filename = f"{timestamp}_{sanitized_speaker_mode}.txt"
+    # Generate filename, with a short random suffix so workers saving in the
+    # same second do not overwrite each other
+    filename = f"{timestamp}_{sanitized_speaker_mode}_{uuid.uuid4().hex[:8]}.txt"
     file_path = scripts_dir / filename
 
     # Clean markdown syntax
@@ -230,3 +252,107 @@ async def convert_text_to_speech(
         return output_path
     except Exception as e:
         raise Exception(f"Error generating speech with Eleven Labs: {str(e)}")
+
+
+class SpeechInProgressError(Exception):
+    """
+    Raised when an identical text-to-speech request is still being generated
+    by another worker after TTS_WAIT_TIMEOUT.
+    """
+
+
+async def _refresh_claim(key: str, claim: dict) -> None:
+    """
+    Keep our pending claim alive while generation is still running. Only
+    refreshes the claim while it is still ours, so a late heartbeat can never
+    overwrite the finished job or revive a released claim.
+    """
+    while True:
+        await asyncio.sleep(TTS_HEARTBEAT_INTERVAL)
+        try:
+            still_ours = await asyncio.to_thread(
+                shared_store.update_if, key, claim, claim, TTS_PENDING_TTL)
+        except Exception as e:
+            # A missed heartbeat only risks a duplicate generation, keep going
+            logger.warning("Could not refresh text-to-speech claim %s: %s", key, e)
+            continue
+        if not still_ours:
+            return
+
+
+async def synthesize_speech(
+    text: str,
+    voice_id: str = "21m00Tcm4TlvDq8ikWAM",
+    model_id: str = "eleven_multilingual_v2",
+    stability: float = 0.5,
+    similarity_boost: float = 0.5
+) -> str:
+    """
+    Convert text to speech once per unique request across all workers.
+    Identical requests reuse the finished audio, or wait for the worker
+    that is already generating it. A waiter only takes over when the
+    generating worker stops refreshing its claim. Otherwise it raises
+    SpeechInProgressError after a short TTS_WAIT_TIMEOUT, releasing its
+    admission slot so the client can retry for the finished result.
+    Returns the path to the generated audio file
+    """
+    params = {
+        "text": text,
+        "voice_id": voice_id,
+        "model_id": model_id,
+        "stability": stability,
+        "similarity_boost": similarity_boost
+    }
+    key = "tts:" + hashlib.sha256(
+        json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    claim = {"status": "pending", "owner": uuid.uuid4().hex}
+    deadline = time.monotonic() + TTS_WAIT_TIMEOUT
+    while True:
+        job = await asyncio.to_thread(shared_store.get, key)
+
+        if job is None:
+            # Nobody is generating it, or the claimant stopped refreshing its claim
+            claimed = await asyncio.to_thread(
+                shared_store.add, key, claim, TTS_PENDING_TTL)
+            if claimed:
+                break
+            continue
+
+        if job["status"] == "done":
+            if os.path.isfile(job["audio_file_path"]):
+                return job["audio_file_path"]
+            # The audio was removed, generate it again
+            await asyncio.to_thread(shared_store.delete, key)
+            continue
+
+        if time.monotonic() > deadline:
+            raise SpeechInProgressError(
+                "This speech is still being generated, please retry later")
+        await asyncio.sleep(TTS_POLL_INTERVAL)
+
+    heartbeat = asyncio.create_task(_refresh_claim(key, claim))
+    try:
+        audio_file_path = await convert_text_to_speech(**params)
+    except Exception:
+        try:
+            # Release the claim so a retry can generate it straight away
+            await asyncio.to_thread(shared_store.delete_if, key, claim)
+        except Exception as e:
+            logger.warning("Could not release text-to-speech claim %s: %s", key, e)
+        raise
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+
+    try:
+        await asyncio.to_thread(
+            shared_store.set,
+            key,
+            {"status": "done", "audio_file_path": audio_file_path},
+            TTS_RESULT_TTL
+        )
+    except Exception as e:
+        # The audio is ready, so the request still succeeds
+        logger.warning("Could not record text-to-speech result %s: %s", key, e)
+    return audio_file_path
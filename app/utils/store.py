@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+# Seconds between sweeps of expired rows, per process
+PURGE_INTERVAL = 60.0
+
+
+def _dumps(value: Any) -> str:
+    # Stable encoding, so stored values can be compared as text
+    return json.dumps(value, sort_keys=True)
+
+
+class SharedStore:
+    """
+    Small key-value store on a local SQLite file, shared by every worker
+    process on the machine. Values are stored as JSON and can expire after
+    a TTL. Connections are opened lazily per process and thread, so the
+    store is safe to create before the server forks its workers. Expired
+    rows are swept at most once per PURGE_INTERVAL as keys are written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _expires_at(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        self.purge_expired()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._maybe_purge()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, _dumps(value), self._expires_at(ttl)),
+        )
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Set a key only if it is missing or expired. Returns True if this
+        call stored the value, which makes it usable as a dedup key or lock.
+        """
+        self._maybe_purge()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            if row and (row[0] is None or row[0] > time.time()):
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, _dumps(value), self._expires_at(ttl)),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Atomically increment a counter and return its new value. The TTL
+        is set when the counter is created, so a counter keyed by time
+        window acts as a fixed-window rate limit.
+        """
+        self._maybe_purge()
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            if row and (row[1] is None or row[1] > now):
+                value = json.loads(row[0]) + amount
+                expires_at = row[1]
+            else:
+                value = amount
+                expires_at = self._expires_at(ttl)
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, _dumps(value), expires_at),
+            )
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update_if(self, key: str, expected: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Replace a live key only if it still holds the expected value.
+        Returns True if the value was replaced.
+        """
+        cursor = self._connect().execute(
+            "UPDATE kv SET value = ?, expires_at = ? WHERE key = ? AND value = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (_dumps(value), self._expires_at(ttl), key, _dumps(expected), time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def delete_if(self, key: str, expected: Any) -> bool:
+        """
+        Delete a key only if it still holds the expected value.
+        """
+        cursor = self._connect().execute(
+            "DELETE FROM kv WHERE key = ? AND value = ?", (key, _dumps(expected)))
+        return cursor.rowcount > 0
+
+    def scan(self, prefix: str) -> dict:
+        """
+        Return all live keys starting with prefix.
+        """
+        rows = self._connect().execute(
+            "SELECT key, value FROM kv WHERE substr(key, 1, ?) = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (len(prefix), prefix, time.time()),
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def purge_expired(self) -> None:
+        self._connect().execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+
+shared_store = SharedStore(
+    os.getenv("SHARED_STATE_PATH", os.path.join(os.getcwd(), "shared_state", "state.db")))